@@ -0,0 +1,304 @@
+"""
+Benchmarks for the Rz_Void AI client hot paths
+Results are written as JSON so runs can be compared over time:
+
+    python bench.py -o bench.json
+    python bench.py --quick --only session --compare bench.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import Ai
+import mock_server
+
+WORDS = ("scan", "port", "socket", "buffer", "python", "thread", "kernel", "packet", "stream", "cache")
+
+
+def sample_text(words: int, seed: int = 0) -> str:
+    return " ".join(WORDS[(seed + i * 7) % len(WORDS)] for i in range(words))
+
+
+def sample_history(context: Ai.ContextBuilder, messages: int, words: int = 60) -> List[Dict]:
+    return [context.message("user" if i % 2 == 0 else "assistant", sample_text(words, i))
+            for i in range(messages)]
+
+
+def sample_stream(events: int, words: int = 3, chunk_size: int = 512) -> List[bytes]:
+    """SSE body as OpenRouter sends it, cut into fixed-size network chunks"""
+    body = [b": OPENROUTER PROCESSING\n\n"]
+    for i in range(events):
+        event = {"choices": [{"index": 0, "delta": {"content": sample_text(words, i) + " "}}]}
+        body.append(b"data: " + json.dumps(event).encode() + b"\n\n")
+    body.append(b"data: [DONE]\n\n")
+    raw = b"".join(body)
+    return [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+
+
+class ReplayTransport:
+    """Transport that replays a recorded SSE body, isolating client-side parsing from the network"""
+
+    def __init__(self, chunks: List[bytes]):
+        self.chunks = chunks
+
+    async def astream_bytes(self, payload: Dict, stats: Optional[Dict] = None):
+        for chunk in self.chunks:
+            yield chunk
+
+    def warm_up(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Bench:
+    """Collects timing samples and summarises them"""
+
+    def __init__(self, repeat: int, only: Optional[str] = None):
+        self.repeat = repeat
+        self.only = only
+        self.results = []
+
+    def wanted(self, name: str) -> bool:
+        return not self.only or self.only in name
+
+    def measure(self, name: str, fn: Callable, setup: Optional[Callable] = None,
+                repeat: Optional[int] = None, **params) -> Optional[Dict]:
+        """Time fn (or fn(setup())) repeatedly; setup cost is not counted"""
+        if not self.wanted(name):
+            return None
+        samples = []
+        for _ in range(repeat or self.repeat):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            samples.append(time.perf_counter() - start)
+        return self.record(name, samples, **params)
+
+    def record(self, name: str, samples: List[float], **params) -> Dict:
+        ordered = sorted(samples)
+        result = {
+            "name": name,
+            "params": params,
+            "runs": len(samples),
+            "min": ordered[0],
+            "median": statistics.median(ordered),
+            "mean": statistics.fmean(ordered),
+            "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+            "max": ordered[-1]
+        }
+        self.results.append(result)
+        label = " ".join(f"{k}={v}" for k, v in params.items())
+        print(f"[+] {name:<18} {label:<34} median {result['median'] * 1000:9.3f} ms  "
+              f"p95 {result['p95'] * 1000:9.3f} ms", file=sys.stderr)
+        return result
+
+
+def bench_payload(bench: Bench, sizes: List[int]):
+    """Message assembly for a request (context budget, summary, system prompt)"""
+    ai = Ai.RzVoidAI(Ai.API_KEY, transport=ReplayTransport([]), load_previous=False)
+    for size in sizes:
+        ai.conversation_history = sample_history(ai.context, size)
+        bench.measure("build_payload", lambda: ai.build_payload("next question"), messages=size)
+    ai.close()
+
+
+def bench_stream(bench: Bench, sizes: List[int]):
+    """SSE decoding alone and the full streaming loop over a replayed body"""
+    for events in sizes:
+        chunks = sample_stream(events)
+
+        def decode():
+            parser = Ai.SSEParser()
+            for chunk in chunks:
+                for data in parser.feed(chunk):
+                    if data != b"[DONE]":
+                        Ai.json_loads(data)
+            parser.close()
+
+        bench.measure("sse_decode", decode, events=events)
+
+        ai = Ai.RzVoidAI(Ai.API_KEY, transport=ReplayTransport(chunks), load_previous=False)
+
+        def consume(_):
+            for _ in ai.stream("stream please"):
+                pass
+
+        bench.measure("stream_loop", consume, setup=ai.new_session, events=events)
+        ai.close()
+
+
+def bench_sessions(bench: Bench, sizes: List[int], codec: str):
+    """Snapshot save, journal append and load at several history sizes"""
+    store = Ai.SessionStore(codec=codec)
+    context = Ai.ContextBuilder()
+    for size in sizes:
+        history = sample_history(context, size)
+        data = {"model": Ai.MODELS["1"], "mode": "general", "history": history,
+                "summary": None, "timestamp": datetime.now().isoformat()}
+        session_id = f"bench_{size}"
+        bench.measure("session_save", lambda: store.save(session_id, data), messages=size, format=codec)
+
+        turn = sample_history(context, 2)
+
+        def append():
+            data["history"].extend(turn)
+            store.append(session_id, data, turn)
+
+        bench.measure("session_append", append, messages=size, format=codec)
+        bench.measure("session_load", lambda: Ai.SessionStore(codec=codec).load(session_id), messages=size, format=codec)
+    store.index.close()
+
+
+def bench_session_dir(bench: Bench, count: int):
+    """Start-up with a large sessions directory: index rebuild and loading the latest session"""
+    if not bench.wanted("session_dir"):
+        return
+    directory = "sessions_many"
+    store = Ai.SessionStore(directory)
+    context = Ai.ContextBuilder()
+    history = sample_history(context, 20)
+    for i in range(count):
+        store.save(f"20240101_{i:06d}", {"model": Ai.MODELS["1"], "mode": "general", "history": history,
+                                         "summary": None, "timestamp": datetime.now().isoformat()})
+    store.index.close()
+
+    def drop_index():
+        for suffix in ("", "-wal", "-shm"):
+            path = os.path.join(directory, "index.db" + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    bench.measure("session_dir_index", lambda _: Ai.SessionStore(directory).index.close(),
+                  setup=drop_index, sessions=count)
+
+    def load_latest():
+        store = Ai.SessionStore(directory)
+        store.load(store.latest_id())
+        store.index.close()
+
+    bench.measure("session_dir_latest", load_latest, sessions=count)
+
+
+def bench_end_to_end(bench: Bench, api_url: Optional[str], requests: int):
+    """Round trips through the real transport against a local endpoint"""
+    if not bench.wanted("e2e"):
+        return
+    server = None
+    if api_url is None:
+        server = mock_server.start(config=mock_server.MockConfig(ttft=0.0, reply_tokens=50))
+        api_url = server.url
+    Ai.API_URL = api_url
+    ai = Ai.RzVoidAI(Ai.API_KEY, load_previous=False)
+    ai.submit(ai.transport.awarm_up()).result()
+
+    bench.measure("e2e_chat", lambda _: ai.chat_completion("ping", use_cache=False),
+                  setup=ai.new_session, repeat=requests)
+
+    ttft = []
+
+    def stream(_):
+        for _ in ai.stream("ping"):
+            pass
+        ttft.append(ai.last_stream["ttft"])
+
+    bench.measure("e2e_stream", stream, setup=ai.new_session, repeat=requests)
+    bench.record("e2e_stream_ttft", ttft)
+    ai.close()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+def metadata() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "httpx": Ai.httpx is not None,
+        "orjson": Ai.json_loads is not json.loads
+    }
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> int:
+    """Print median ratios against an earlier run; returns the number of regressions"""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        before = baseline.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if not before or not before["median"]:
+            continue
+        ratio = result["median"] / before["median"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        label = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"[=] {result['name']:<18} {label:<34} {ratio:6.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Rz_Void AI client")
+    parser.add_argument("-o", "--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="Samples per benchmark")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes for a fast smoke run")
+    parser.add_argument("--only", help="Run benchmarks whose name contains this string")
+    parser.add_argument("--session-format", default=Ai.SESSION_FORMAT, choices=sorted(Ai.SESSION_CODECS),
+                        help="Snapshot format for the session benchmarks")
+    parser.add_argument("--api-url", help="End-to-end endpoint (default: an in-process mock_server)")
+    parser.add_argument("--compare", help="Earlier JSON results to compare medians against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Median ratio counted as a regression")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    history_sizes = [10, 1000] if args.quick else [10, 1000, 10000]
+    stream_sizes = [100] if args.quick else [100, 2000]
+    session_dir = 200 if args.quick else 2000
+    repeat = 5 if args.quick else args.repeat
+
+    bench = Bench(repeat, args.only)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="rzvoid_bench_") as workdir:
+        os.chdir(workdir)  # sessions/, caches and router stats stay out of the real tree
+        try:
+            bench_payload(bench, history_sizes)
+            bench_stream(bench, stream_sizes)
+            bench_sessions(bench, history_sizes, args.session_format)
+            bench_session_dir(bench, session_dir)
+            bench_end_to_end(bench, args.api_url, repeat)
+        finally:
+            os.chdir(cwd)
+
+    report = json.dumps({"meta": metadata(), "results": bench.results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+    if args.compare:
+        sys.exit(1 if compare(bench.results, args.compare, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Local stand-in for the OpenRouter chat completions API
+Serves /api/v1/chat/completions (plain JSON and SSE streaming) for offline runs:
+
+    python mock_server.py --port 8089 --ttft 0.2 --token-rate 80
+    RZVOID_API_URL=http://127.0.0.1:8089/api/v1/chat/completions python Ai.py
+"""
+
+import sys
+import json
+import random
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+CHAT_PATH = "/api/v1/chat/completions"
+WORDS = ("the", "packet", "kernel", "socket", "buffer", "thread", "python", "stream",
+         "cache", "index", "token", "session", "router", "latency", "queue", "shell")
+
+
+class MockConfig:
+    """Behaviour knobs shared by all handler threads"""
+
+    def __init__(self, ttft: float = 0.05, token_rate: float = 0.0, jitter: float = 0.0,
+                 reply_tokens: int = 50, error_rate: float = 0.0, error_status: int = 503,
+                 retry_after: Optional[float] = None, chunk_tokens: int = 1,
+                 malformed_rate: float = 0.0, seed: Optional[int] = None):
+        self.ttft = ttft  # seconds before headers / first token
+        self.token_rate = token_rate  # tokens per second after the first, 0 = as fast as possible
+        self.jitter = jitter  # +/- fraction applied to every delay
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.chunk_tokens = max(1, chunk_tokens)  # tokens per SSE event
+        self.malformed_rate = malformed_rate  # share of SSE events sent as broken JSON
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def delay(self, seconds: float) -> float:
+        if seconds <= 0 or not self.jitter:
+            return max(seconds, 0.0)
+        with self.lock:
+            return seconds * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "RzVoidMock/1.0"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_empty(404)
+            return
+        with self.server.config.lock:
+            body = json.dumps(self.server.config.stats).encode()
+        self.send_body(200, body)
+
+    def do_POST(self):
+        config = self.server.config
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        config.count("requests")
+        config.count("bytes_in", len(raw))
+
+        if self.path.split("?")[0] != CHAT_PATH:
+            self.send_empty(404)
+            return
+        try:
+            payload = json.loads(raw)
+            messages = payload["messages"]
+        except (ValueError, KeyError, TypeError):
+            self.send_error_body(400, "Invalid request body")
+            return
+
+        time.sleep(config.delay(config.ttft))
+        if config.roll(config.error_rate):
+            config.count("errors")
+            self.send_error_body(config.error_status, "Injected failure")
+            return
+
+        reply = self.reply_tokens(payload)
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in messages),
+            "completion_tokens": len(reply)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if payload.get("stream"):
+            config.count("streams")
+            self.stream_reply(payload["model"], reply, usage)
+        else:
+            self.pause(len(reply) - 1)
+            body = json.dumps({
+                "id": f"gen-mock-{time.time_ns()}",
+                "object": "chat.completion",
+                "model": payload["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(reply)},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            }).encode()
+            self.send_body(200, body)
+
+    def reply_tokens(self, payload: Dict):
+        config = self.server.config
+        count = config.reply_tokens
+        if payload.get("max_tokens"):
+            count = min(count, int(payload["max_tokens"]))
+        return [WORDS[i % len(WORDS)] for i in range(max(count, 1))]
+
+    def pause(self, tokens: int):
+        config = self.server.config
+        if config.token_rate > 0 and tokens > 0:
+            time.sleep(config.delay(tokens / config.token_rate))
+
+    def stream_reply(self, model: str, reply, usage: Dict):
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        self.write_chunk(b": OPENROUTER PROCESSING\n\n")
+        for start in range(0, len(reply), config.chunk_tokens):
+            if start:
+                self.pause(config.chunk_tokens)
+            words = reply[start:start + config.chunk_tokens]
+            text = " ".join(words) + (" " if start + config.chunk_tokens < len(reply) else "")
+            if config.roll(config.malformed_rate):
+                self.write_chunk(b"data: {\"choices\": [\n\n")
+                continue
+            event = {"model": model, "choices": [{"index": 0, "delta": {"content": text}}]}
+            self.write_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+
+        final = {"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        self.write_chunk(b"data: " + json.dumps(final).encode() + b"\n\n")
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+        self.server.config.count("bytes_out", len(data))
+
+    def send_body(self, status: int, body: bytes, headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.config.count("bytes_out", len(body))
+
+    def send_empty(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_error_body(self, status: int, message: str):
+        headers = {}
+        if self.server.config.retry_after is not None and status in (429, 503):
+            headers["Retry-After"] = f"{self.server.config.retry_after:g}"
+        body = json.dumps({"error": {"code": status, "message": message}}).encode()
+        self.send_body(status, body, headers)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig, verbose: bool = False):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.verbose = verbose
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{CHAT_PATH}"
+
+
+def start(host: str = "127.0.0.1", port: int = 0, config: Optional[MockConfig] = None) -> MockServer:
+    """Serve in a daemon thread; port 0 picks a free port (see server.url)"""
+    server = MockServer((host, port), config or MockConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of the OpenRouter chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens per second after the first (0 = unthrottled)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- fraction applied to delays")
+    parser.add_argument("--reply-tokens", type=int, default=50, help="Tokens per reply (capped by max_tokens)")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="Tokens per SSE event")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with 429/503")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of SSE events sent as broken JSON")
+    parser.add_argument("--seed", type=int, help="Seed for error and jitter injection")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    config = MockConfig(ttft=args.ttft, token_rate=args.token_rate, jitter=args.jitter,
+                        reply_tokens=args.reply_tokens, error_rate=args.error_rate,
+                        error_status=args.error_status, retry_after=args.retry_after,
+                        chunk_tokens=args.chunk_tokens, malformed_rate=args.malformed_rate, seed=args.seed)
+    server = MockServer((args.host, args.port), config, verbose=args.verbose)
+    print(f"[+] Mock OpenRouter listening on {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n[+] Served {config.stats['requests']} requests", file=sys.stderr)
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Regression tests for session journal replay and SSE decoding"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ai import SessionStore, SSEParser
+
+
+def turn(n: int):
+    return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+
+class JournalReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SessionStore(self.tmp.name, fsync="never")
+        self.history = []
+        self.store.save("s", self.data())  # later turns go to the journal
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def data(self):
+        return {"model": "m", "mode": "general", "history": self.history, "timestamp": "2026-01-01T00:00:00"}
+
+    def record(self, n: int):
+        messages = turn(n)
+        self.history.extend(messages)
+        self.store.append("s", self.data(), messages)
+
+    def reopen(self):
+        return SessionStore(self.tmp.name, fsync="never").load("s")
+
+    def test_replays_journal_after_snapshot(self):
+        self.history.extend(turn(0))
+        self.store.save("s", self.data())
+        self.record(1)
+        self.record(2)
+        self.assertEqual(self.reopen()["history"], turn(0) + turn(1) + turn(2))
+
+    def test_truncates_partial_record(self):
+        self.record(0)
+        journal = self.store.journal_path("s")
+        good = os.path.getsize(journal)
+        with open(journal, "a") as f:
+            f.write('{"seq": 2, "messages": [')
+        self.assertEqual(self.reopen()["history"], turn(0))
+        self.assertEqual(os.path.getsize(journal), good)
+
+    def test_truncates_record_without_newline(self):
+        self.record(0)
+        journal = self.store.journal_path("s")
+        good = os.path.getsize(journal)
+        with open(journal, "a") as f:
+            f.write(json.dumps({"seq": 2, "messages": turn(1), "model": "m", "mode": "general",
+                                "timestamp": "2026-01-01T00:00:00"}))
+        self.assertEqual(self.reopen()["history"], turn(0))
+        self.assertEqual(os.path.getsize(journal), good)
+
+    def test_appends_cleanly_after_truncation(self):
+        self.record(0)
+        with open(self.store.journal_path("s"), "a") as f:
+            f.write('{"seq": 2')
+        store = SessionStore(self.tmp.name, fsync="never")
+        data = store.load("s")
+        data["history"].extend(turn(1))
+        store.append("s", data, turn(1))
+        self.assertEqual(self.reopen()["history"], turn(0) + turn(1))
+
+    def test_skips_records_folded_into_snapshot(self):
+        self.record(0)
+        journal = self.store.journal_path("s")
+        with open(journal) as f:
+            stale = f.read()
+        self.history.extend(turn(1))
+        self.store.save("s", self.data())
+        with open(journal, "w") as f:
+            f.write(stale)
+        self.assertEqual(self.reopen()["history"], turn(0) + turn(1))
+
+
+class SSEParserTest(unittest.TestCase):
+    def test_events_split_across_chunks(self):
+        parser = SSEParser()
+        events = []
+        for chunk in (b"data: {\"a\"", b": 1}\r", b"\n\r\n: keep-alive\n\ndata: [DONE]\n\n"):
+            events.extend(parser.feed(chunk))
+        self.assertEqual(events, [b'{"a": 1}', b"[DONE]"])
+        self.assertEqual(parser.comments, 1)
+
+    def test_multiline_data_and_close(self):
+        parser = SSEParser()
+        self.assertEqual(parser.feed(b"data: one\ndata:two\n"), [])
+        self.assertEqual(parser.close(), [b"one\ntwo"])
+
+
+if __name__ == "__main__":
+    unittest.main()